@@ -0,0 +1,155 @@
+"""Bulk data corrections for the streak database.
+
+Every correction is a single set-based statement followed by an incremental
+recompute of the affected users' streaks. The same functions back the admin
+bot commands and this command-line interface:
+
+    python admin.py grace 2025-06-05 --chat -1001234567890
+    python admin.py revert 123456789 --since 2025-06-10
+
+Chat membership is learned from /submit, so a chat's members are only known
+once they have submitted there since chat_members was added; older
+submissions don't record a chat and are not backfilled.
+"""
+import argparse
+import logging
+import os
+import sqlite3
+from datetime import date, timedelta
+from log_config import setup_logging
+from user_cache import ensure_users_table
+
+def ensure_admin_tables(conn):
+    """Create the chat_members table and the corrections counter."""
+    # Chats each user has submitted from
+    conn.execute('''CREATE TABLE IF NOT EXISTS chat_members
+                    (chat_id INTEGER NOT NULL, user_id INTEGER NOT NULL, PRIMARY KEY (chat_id, user_id))''')
+    # Incremented by every correction so running bots know to drop their caches
+    conn.execute('''CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)''')
+    conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('corrections_version', 0)")
+    conn.commit()
+
+def corrections_version(conn):
+    """Return the number of corrections written so far."""
+    return conn.execute("SELECT value FROM meta WHERE key='corrections_version'").fetchone()[0]
+
+def has_chat_members(conn, chat_id):
+    """Check whether any user has been recorded as a member of ``chat_id``."""
+    return conn.execute("SELECT 1 FROM chat_members WHERE chat_id=? LIMIT 1", (chat_id,)).fetchone() is not None
+
+def _bump_corrections_version(conn):
+    conn.execute("UPDATE meta SET value = value + 1 WHERE key='corrections_version'")
+
+def grant_grace(conn, day, chat_id):
+    """Add a grace day on ``day`` for every member of ``chat_id`` who missed it.
+
+    Only users who submitted the day before are covered, so a grace day always
+    continues a streak and never starts one on its own. Grace rows have no PR
+    link. ``day`` must be in the past. Returns the ids of the users that received it.
+    """
+    if day >= date.today():
+        raise ValueError(f"grace day {day} is not in the past")
+    day_str = day.isoformat()
+    with conn:
+        c = conn.cursor()
+        c.execute('''INSERT INTO submissions (user_id, username, submission_date, streak, pr_link)
+                     SELECT m.user_id, u.username, ?, 0, NULL FROM chat_members m
+                     LEFT JOIN users u ON u.user_id = m.user_id
+                     WHERE m.chat_id = ?
+                       AND EXISTS (SELECT 1 FROM submissions s WHERE s.user_id = m.user_id AND s.submission_date = ?)
+                       AND NOT EXISTS (SELECT 1 FROM submissions s WHERE s.user_id = m.user_id AND s.submission_date = ?)
+                     RETURNING user_id''',
+                  (day_str, chat_id, (day - timedelta(days=1)).isoformat(), day_str))
+        user_ids = [row[0] for row in c.fetchall()]
+        recompute_streaks(conn, user_ids, day)
+        if user_ids:
+            _bump_corrections_version(conn)
+    logging.info("Granted grace for %s to %s user(s) in chat %s", day_str, len(user_ids), chat_id,
+                 extra={"event": "admin.grace", "day": day_str, "chat_id": chat_id, "users": len(user_ids)})
+    return user_ids
+
+def revert_submissions(conn, user_id, since):
+    """Delete a user's submissions from ``since`` onwards. Returns the number of rows removed."""
+    with conn:
+        c = conn.cursor()
+        c.execute("DELETE FROM submissions WHERE user_id=? AND submission_date>=?", (user_id, since.isoformat()))
+        removed = c.rowcount
+        recompute_streaks(conn, [user_id], since)
+        if removed:
+            _bump_corrections_version(conn)
+    logging.info("Reverted %s submission(s) of user %s since %s", removed, user_id, since,
+                 extra={"event": "admin.revert", "user_id": user_id, "since": since, "removed": removed})
+    return removed
+
+def recompute_streaks(conn, user_ids, since):
+    """Recompute streaks of ``user_ids`` for rows dated ``since`` or later.
+
+    Rows before ``since`` are untouched; the last one seeds the recount. The
+    users table (latest state and best streak) is refreshed for each user.
+    Runs inside the caller's transaction.
+    """
+    since_str = since.isoformat()
+    c = conn.cursor()
+    for user_id in user_ids:
+        c.execute("SELECT submission_date, streak FROM submissions WHERE user_id=? AND submission_date<? "
+                  "ORDER BY submission_date DESC LIMIT 1", (user_id, since_str))
+        seed = c.fetchone()
+        prev_date = date.fromisoformat(seed[0]) if seed else None
+        streak = seed[1] if seed else 0
+
+        c.execute("SELECT rowid, submission_date, streak FROM submissions WHERE user_id=? AND submission_date>=? "
+                  "ORDER BY submission_date", (user_id, since_str))
+        updates = []
+        for rowid, day_str, old_streak in c.fetchall():
+            day = date.fromisoformat(day_str)
+            streak = streak + 1 if prev_date == day - timedelta(days=1) else 1
+            if streak != old_streak:
+                updates.append((streak, rowid))
+            prev_date = day
+        c.executemany("UPDATE submissions SET streak=? WHERE rowid=?", updates)
+
+        c.execute('''UPDATE users SET
+                     streak = COALESCE((SELECT streak FROM submissions WHERE user_id = users.user_id
+                                        ORDER BY submission_date DESC LIMIT 1), 0),
+                     last_date = (SELECT MAX(submission_date) FROM submissions WHERE user_id = users.user_id),
+                     best_streak = COALESCE((SELECT MAX(streak) FROM submissions WHERE user_id = users.user_id), 0)
+                     WHERE user_id = ?''', (user_id,))
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk corrections for the streak database.")
+    parser.add_argument("--db", default="submissions.db", help="path to the SQLite database")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    grace = commands.add_parser("grace", help="grant a grace day to every member of a chat")
+    grace.add_argument("day", type=date.fromisoformat, help="date to grant (YYYY-MM-DD)")
+    grace.add_argument("--chat", type=int, required=True, help="group chat id")
+
+    revert = commands.add_parser("revert", help="delete a user's submissions from a date onwards")
+    revert.add_argument("user_id", type=int)
+    revert.add_argument("--since", type=date.fromisoformat, required=True, help="first date to delete (YYYY-MM-DD)")
+
+    args = parser.parse_args()
+    setup_logging()
+
+    if not os.path.exists(args.db):
+        parser.error(f"{args.db} does not exist")
+    conn = sqlite3.connect(args.db)
+    # A wrong --db path would otherwise get an empty users table that the bot never backfills
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='submissions'").fetchone():
+        parser.error(f"{args.db} has no submissions table; is --db pointing at the bot's database?")
+    ensure_users_table(conn)
+    ensure_admin_tables(conn)
+    if args.command == "grace":
+        try:
+            user_ids = grant_grace(conn, args.day, args.chat)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"Granted grace for {args.day} to {len(user_ids)} user(s)")
+        if not has_chat_members(conn, args.chat):
+            print(f"No members are recorded for chat {args.chat} yet; members are added when they /submit there")
+    else:
+        removed = revert_submissions(conn, args.user_id, args.since)
+        print(f"Removed {removed} submission(s) of user {args.user_id}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Measure cold-start import cost of the bot entry points.
+
+Runs ``python -X importtime -c "import <module>"`` in a fresh interpreter for
+each module and prints the total wall time plus the slowest imports by
+cumulative time. Run it from the repository root:
+
+    python benchmarks/startup.py            # bot and scheduler
+    python benchmarks/startup.py bot -n 20  # one module, top 20 imports
+    python benchmarks/startup.py --root ../baseline-checkout
+
+Results are recorded in benchmarks/startup_report.txt.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def measure(module, runs, root=REPO_ROOT):
+    """Import a module in fresh interpreters and return (best wall time, importtime rows)."""
+    best = None
+    rows = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=root, capture_output=True, text=True,
+        )
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{result.stderr.splitlines()[-1]}")
+        if best is None or elapsed < best:
+            best = elapsed
+            rows = parse_importtime(result.stderr)
+    return best, rows
+
+def parse_importtime(stderr):
+    """Parse ``-X importtime`` output into (self_us, cumulative_us, name) tuples."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((int(self_us), int(cumulative_us), name.rstrip()))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=["bot", "scheduler"])
+    parser.add_argument("-n", "--top", type=int, default=10, help="number of imports to list")
+    parser.add_argument("-r", "--runs", type=int, default=5, help="fresh interpreters per module (best is kept)")
+    parser.add_argument("--root", default=REPO_ROOT, help="checkout to measure (default: this one)")
+    args = parser.parse_args()
+
+    for module in args.modules:
+        wall, rows = measure(module, args.runs, args.root)
+        # Top-level imports are the ones with no leading indentation after the separator
+        total_us = sum(cum for _, cum, name in rows if not name.startswith("  "))
+        print(f"== {module} ==")
+        print(f"wall time (best of {args.runs}): {wall * 1000:.1f} ms, import time: {total_us / 1000:.1f} ms")
+        print(f"{'cumulative [ms]':>16} {'self [ms]':>10}  module")
+        for self_us, cum_us, name in sorted(rows, key=lambda r: r[1], reverse=True)[:args.top]:
+            print(f"{cum_us / 1000:>16.1f} {self_us / 1000:>10.1f}  {name.strip()}")
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Measure the memory footprint of UserStateCache.
+
+Fills an in-memory database with N users, loads every one of them into a
+cache sized to hold them all and reports the Python heap used by the cache
+(tracemalloc) together with hit/miss counters. Run it from the repository root:
+
+    python benchmarks/user_cache_memory.py            # 100k users
+    python benchmarks/user_cache_memory.py -u 500000
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from user_cache import UserStateCache, ensure_users_table
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-u", "--users", type=int, default=100_000)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(":memory:")
+    conn.execute('''CREATE TABLE submissions
+                    (user_id INTEGER, username TEXT, submission_date TEXT, streak INTEGER, pr_link TEXT)''')
+    ensure_users_table(conn)
+    start = date(2025, 6, 1)
+    conn.executemany("INSERT INTO users (user_id, username, streak, last_date) VALUES (?, ?, ?, ?)",
+                     ((1_000_000 + i, f"builder_{i}", i % 30 + 1, (start + timedelta(days=i % 30)).isoformat())
+                      for i in range(args.users)))
+    conn.commit()
+
+    cache = UserStateCache(conn, capacity=args.users)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for i in range(args.users):
+        cache.get(1_000_000 + i)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    # Second pass is served entirely from memory
+    for i in range(args.users):
+        cache.get(1_000_000 + i)
+
+    used = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    stats = cache.stats()
+    print(f"users cached:   {stats['size']:,}")
+    print(f"cache footprint: {used / 1024 / 1024:.1f} MiB ({used / args.users:.0f} bytes/user)")
+    print(f"hits/misses:    {stats['hits']:,}/{stats['misses']:,} (hit rate {stats['hit_rate']:.0%})")
+
+if __name__ == "__main__":
+    main()
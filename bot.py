@@ -1,46 +1,146 @@
 from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+from telegram.ext import Application, CommandHandler, MessageHandler, TypeHandler, filters, ContextTypes
 import sqlite3
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
 from dotenv import load_dotenv
 import os
 import logging
 import random
-import requests
-from bs4 import BeautifulSoup
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-import pytz
+import re
+
+# Load environment variables (before the modules below read their settings)
+load_dotenv()
+
+from user_cache import UserStateCache, ensure_users_table
+import history
+import admin
+from log_config import correlation_id, setup_logging, span
 
 # Enable logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+setup_logging()
 
-# Load environment variables
-load_dotenv()
 API_KEY = os.getenv("API_KEY")
 
 # Support for multiple group chat IDs (comma-separated in .env)
 group_chat_ids_str = os.getenv("GROUP_CHAT_ID", "")
 GROUP_CHAT_IDS = [int(chat_id.strip()) for chat_id in group_chat_ids_str.split(",") if chat_id.strip()]
 
+# Telegram user IDs allowed to run moderation commands (comma-separated in .env)
+admin_user_ids_str = os.getenv("ADMIN_USER_IDS", "")
+ADMIN_USER_IDS = {int(user_id.strip()) for user_id in admin_user_ids_str.split(",") if user_id.strip()}
+
 # Constants
 CHALLENGE_URL = "https://web3compass.xyz/challenge-calendar"
-utc = pytz.UTC
+PR_LINK_PATTERN = re.compile(r"https://github\.com/The-Web3-Compass/30-days-of-solidity-submissions/pull/\d+")
+utc = timezone.utc
+
+# Database setup (opened on first use so importing the bot stays cheap)
+_conn = None
+
+def get_db():
+    """Return the database connection, creating the tables on first use."""
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect('submissions.db')
+        c = _conn.cursor()
+
+        # Create submissions table with PR link and username
+        c.execute('''CREATE TABLE IF NOT EXISTS submissions
+                     (user_id INTEGER, username TEXT, submission_date TEXT, streak INTEGER, pr_link TEXT)''')
+
+        # Create daily challenges table
+        c.execute('''CREATE TABLE IF NOT EXISTS daily_challenges
+                     (day INTEGER PRIMARY KEY, title TEXT, description TEXT, youtube_link TEXT)''')
+        _conn.commit()
+
+        # Create users table holding each user's latest streak and username
+        ensure_users_table(_conn)
+
+        # Index for per-user date range queries (/history and /calendar)
+        history.ensure_history_index(_conn)
+
+        # Chats each user submitted from and the corrections counter, used by bulk corrections
+        admin.ensure_admin_tables(_conn)
+    return _conn
+
+_user_cache = None
+
+def get_user_cache():
+    """Return the per-user state cache, creating it on first use."""
+    global _user_cache
+    if _user_cache is None:
+        _user_cache = UserStateCache(get_db())
+    return _user_cache
+
+# Top 10 leaderboard rows as (user_id, username, best_streak), loaded on first use
+_leaderboard = None
+
+def get_leaderboard():
+    """Return the cached leaderboard, reading it from the users table if needed."""
+    global _leaderboard
+    if _leaderboard is None:
+        c = get_db().cursor()
+        c.execute("SELECT user_id, username, best_streak FROM users WHERE best_streak > 0 "
+                  "ORDER BY best_streak DESC LIMIT 10")
+        _leaderboard = c.fetchall()
+    return _leaderboard
+
+def update_leaderboard(user_id, username, streak):
+    """Fold a user's new streak (or new username) into the cached leaderboard."""
+    global _leaderboard
+    if _leaderboard is None:
+        return
+    rows = [row for row in _leaderboard if row[0] != user_id]
+    listed = [row for row in _leaderboard if row[0] == user_id]
+    best = max(streak, listed[0][2]) if listed else streak
+    if best > 0:
+        rows.append((user_id, username, best))
+    rows.sort(key=lambda row: row[2], reverse=True)
+    _leaderboard = rows[:10]
 
-# Database setup
-conn = sqlite3.connect('submissions.db')
-c = conn.cursor()
+def refresh_after_correction(user_ids):
+    """Update caches for users whose submissions were changed by an admin correction."""
+    global _leaderboard, _corrections_version
+    # If ours is the only correction since the last check, the caches below are
+    # already up to date and sync_caches doesn't need to drop them
+    version = admin.corrections_version(get_db())
+    if _corrections_version is not None and version == _corrections_version + 1:
+        _corrections_version = version
 
-# Create submissions table with PR link and username
-c.execute('''CREATE TABLE IF NOT EXISTS submissions
-             (user_id INTEGER, username TEXT, submission_date TEXT, streak INTEGER, pr_link TEXT)''')
+    user_cache = get_user_cache()
+    for user_id in user_ids:
+        user_cache.invalidate(user_id)
+        history.invalidate(user_id)
 
-# Create daily challenges table
-c.execute('''CREATE TABLE IF NOT EXISTS daily_challenges
-             (day INTEGER PRIMARY KEY, title TEXT, description TEXT, youtube_link TEXT)''')
-conn.commit()
+    if _leaderboard is None or not user_ids:
+        return
+    affected = set(user_ids)
+    if any(row[0] in affected for row in _leaderboard):
+        # A listed user's best may have dropped, so the next one in line is unknown
+        _leaderboard = None
+        return
+    c = get_db().cursor()
+    c.execute(f"SELECT user_id, username, best_streak FROM users WHERE user_id IN ({','.join('?' * len(user_ids))})",
+              list(user_ids))
+    for user_id, username, best_streak in c.fetchall():
+        update_leaderboard(user_id, username, best_streak)
+
+async def set_correlation_id(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Tag every log line written while handling this update, including Telegram API requests."""
+    correlation_id.set(f"update-{update.update_id}")
+
+_corrections_version = None
+
+async def sync_caches(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Drop in-memory caches when another process (e.g. the admin CLI) has applied a correction."""
+    global _corrections_version, _leaderboard
+    # Only corrections bump this counter; submissions and the scheduler's writes don't
+    version = admin.corrections_version(get_db())
+    if _corrections_version is not None and version != _corrections_version:
+        get_user_cache().clear()
+        history.clear()
+        _leaderboard = None
+    _corrections_version = version
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /start is issued."""
@@ -49,6 +149,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         "Ready to level up your blockchain skills? Here's how to participate:\n\n"
         "🔹 `/submit <github_pr_link>` - Submit your daily solution\n"
         "🔹 `/streak` - Check your current streak\n"
+        "🔹 `/history` - See your last 30 days of submissions\n"
+        "🔹 `/calendar` - See your 30-day streak calendar\n"
         "🔹 `/leaderboard` - See the top builders\n\n"
         "Let's build the decentralized future together! 💪",
         parse_mode="Markdown"
@@ -65,29 +167,33 @@ async def submit(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         )
         return
 
-    pr_link = context.args[0]
-    if not pr_link.startswith('https://github.com/The-Web3-Compass/30-days-of-solidity-submissions/pull'):
+    # Only the canonical PR URL is stored; it is later rendered inside Markdown links
+    match = PR_LINK_PATTERN.match(context.args[0])
+    if not match:
         await update.message.reply_text(
             "❌ *Invalid Link Detected!*\n\n"
-            "Please provide a valid GitHub PR link starting with `https://github.com/The-Web3-Compass/30-days-of-solidity-submissions/pull`",
+            "Please provide a valid GitHub PR link like `https://github.com/The-Web3-Compass/30-days-of-solidity-submissions/pull/123`",
             parse_mode="Markdown"
         )
         return
+    pr_link = match.group(0)
 
     user_id = update.message.from_user.id
     today = datetime.now().date()
+    conn = get_db()
+    user_cache = get_user_cache()
 
     # Check last submission
-    c.execute("SELECT submission_date, streak FROM submissions WHERE user_id=? ORDER BY submission_date DESC LIMIT 1", (user_id,))
-    last_submission = c.fetchone()
+    with span("db.user_state", user_id=user_id):
+        last_submission = user_cache.get(user_id)
 
     if last_submission:
-        last_date = datetime.strptime(last_submission[0], '%Y-%m-%d').date()
+        last_date = last_submission.last_date
         if last_date == today:
             await update.message.reply_text("You've already submitted today!")
             return
         elif last_date == today - timedelta(days=1):
-            streak = last_submission[1] + 1
+            streak = last_submission.streak + 1
         else:
             streak = 1
     else:
@@ -99,42 +205,49 @@ async def submit(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         username = update.message.from_user.first_name
     
     # Save submission with PR link and username
-    c.execute("INSERT INTO submissions (user_id, username, submission_date, streak, pr_link) VALUES (?, ?, ?, ?, ?)",
-              (user_id, username, today.strftime('%Y-%m-%d'), streak, pr_link))
-    conn.commit()
+    with span("db.submit", user_id=user_id):
+        conn.execute("INSERT INTO submissions (user_id, username, submission_date, streak, pr_link) VALUES (?, ?, ?, ?, ?)",
+                     (user_id, username, today.strftime('%Y-%m-%d'), streak, pr_link))
+        conn.execute("INSERT OR IGNORE INTO chat_members (chat_id, user_id) VALUES (?, ?)",
+                     (update.effective_chat.id, user_id))
+        # Commits the submission together with the user's new state
+        user_cache.record_submission(user_id, username, today, streak)
+    history.invalidate(user_id)
+    update_leaderboard(user_id, username, streak)
 
-    # Add milestone badges
-    if streak == 5:
-        await update.message.reply_text(
-            f"🎯 *PR SUBMITTED SUCCESSFULLY!* 🎯\n\n"
-            f"🔥 *Streak: {streak} days* 🔥\n\n"
-            f"🏆 Achievement Unlocked: *SOLIDITY NOVICE* 🏆\n\n"
-            f"Keep building! You're on your way to greatness!",
-            parse_mode="Markdown"
-        )
-    elif streak == 15:
-        await update.message.reply_text(
-            f"🎯 *PR SUBMITTED SUCCESSFULLY!* 🎯\n\n"
-            f"🔥 *Streak: {streak} days* 🔥\n\n"
-            f"🏆 Achievement Unlocked: *SOLIDITY ENTHUSIAST* 🏆\n\n"
-            f"Amazing progress! You're becoming a true blockchain builder!",
-            parse_mode="Markdown"
-        )
-    elif streak == 30:
-        await update.message.reply_text(
-            f"🎯 *PR SUBMITTED SUCCESSFULLY!* 🎯\n\n"
-            f"🔥 *LEGENDARY STREAK: {streak} days* 🔥\n\n"
-            f"🏆 ULTIMATE Achievement Unlocked: *SOLIDITY MASTER* 🏆\n\n"
-            f"INCREDIBLE WORK! You've completed the entire challenge! 🚀",
-            parse_mode="Markdown"
-        )
-    else:
-        await update.message.reply_text(
-            f"🎯 *PR SUBMITTED SUCCESSFULLY!* 🎯\n\n"
-            f"🔥 *Current Streak: {streak} days* 🔥\n\n"
-            f"Keep up the great work! Building consistently is the key to mastery.",
-            parse_mode="Markdown"
-        )
+    with span("send.reply", user_id=user_id):
+        # Add milestone badges
+        if streak == 5:
+            await update.message.reply_text(
+                f"🎯 *PR SUBMITTED SUCCESSFULLY!* 🎯\n\n"
+                f"🔥 *Streak: {streak} days* 🔥\n\n"
+                f"🏆 Achievement Unlocked: *SOLIDITY NOVICE* 🏆\n\n"
+                f"Keep building! You're on your way to greatness!",
+                parse_mode="Markdown"
+            )
+        elif streak == 15:
+            await update.message.reply_text(
+                f"🎯 *PR SUBMITTED SUCCESSFULLY!* 🎯\n\n"
+                f"🔥 *Streak: {streak} days* 🔥\n\n"
+                f"🏆 Achievement Unlocked: *SOLIDITY ENTHUSIAST* 🏆\n\n"
+                f"Amazing progress! You're becoming a true blockchain builder!",
+                parse_mode="Markdown"
+            )
+        elif streak == 30:
+            await update.message.reply_text(
+                f"🎯 *PR SUBMITTED SUCCESSFULLY!* 🎯\n\n"
+                f"🔥 *LEGENDARY STREAK: {streak} days* 🔥\n\n"
+                f"🏆 ULTIMATE Achievement Unlocked: *SOLIDITY MASTER* 🏆\n\n"
+                f"INCREDIBLE WORK! You've completed the entire challenge! 🚀",
+                parse_mode="Markdown"
+            )
+        else:
+            await update.message.reply_text(
+                f"🎯 *PR SUBMITTED SUCCESSFULLY!* 🎯\n\n"
+                f"🔥 *Current Streak: {streak} days* 🔥\n\n"
+                f"Keep up the great work! Building consistently is the key to mastery.",
+                parse_mode="Markdown"
+            )
 
 async def streak(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Check user's current streak."""
@@ -145,16 +258,16 @@ async def streak(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not username:
         username = update.message.from_user.first_name
     
-    c.execute("SELECT streak, username FROM submissions WHERE user_id=? ORDER BY submission_date DESC LIMIT 1", (user_id,))
-    result = c.fetchone()
+    user_cache = get_user_cache()
+    with span("db.user_state", user_id=user_id):
+        result = user_cache.get(user_id)
     if result:
-        streak_days = result[0]
-        stored_username = result[1] if len(result) > 1 else None
+        streak_days = result.streak
         
-        # Update username if it has changed
-        if stored_username != username:
-            c.execute("UPDATE submissions SET username=? WHERE user_id=?", (username, user_id))
-            conn.commit()
+        # Update username if it has changed (a single row in the users table)
+        if result.username != username:
+            user_cache.set_username(user_id, username)
+            update_leaderboard(user_id, username, 0)
         
         if streak_days >= 20:
             emoji = "🔥🔥🔥"
@@ -168,31 +281,43 @@ async def streak(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             
         user_display = f"@{username}" if username else "Your"
         
-        await update.message.reply_text(
-            f"{emoji} *STREAK STATS* {emoji}\n\n"
-            f"{user_display} current streak is *{streak_days} days*!\n\n"
-            f"{message}",
-            parse_mode="Markdown"
-        )
+        with span("send.reply", user_id=user_id):
+            await update.message.reply_text(
+                f"{emoji} *STREAK STATS* {emoji}\n\n"
+                f"{user_display} current streak is *{streak_days} days*!\n\n"
+                f"{message}",
+                parse_mode="Markdown"
+            )
     else:
         user_display = f"@{username}" if username else "You"
-        await update.message.reply_text(
-            f"😢 *No Submissions Yet*\n\n"
-            f"{user_display} haven't submitted any solutions yet. \n"
-            f"Submit your first solution with `/submit <github_pr_link>` to start your streak!",
-            parse_mode="Markdown"
-        )
+        with span("send.reply", user_id=user_id):
+            await update.message.reply_text(
+                f"😢 *No Submissions Yet*\n\n"
+                f"{user_display} haven't submitted any solutions yet. \n"
+                f"Submit your first solution with `/submit <github_pr_link>` to start your streak!",
+                parse_mode="Markdown"
+            )
+
+async def show_history(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show the user's submissions over the last 30 days."""
+    user_id = update.message.from_user.id
+    with span("db.history", user_id=user_id):
+        message = history.get_rendered(get_db(), user_id, "history", datetime.now().date())
+    with span("send.reply", user_id=user_id):
+        await update.message.reply_text(message, parse_mode="Markdown", disable_web_page_preview=True)
+
+async def calendar(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show the user's 30-day streak calendar."""
+    user_id = update.message.from_user.id
+    with span("db.calendar", user_id=user_id):
+        message = history.get_rendered(get_db(), user_id, "calendar", datetime.now().date())
+    with span("send.reply", user_id=user_id):
+        await update.message.reply_text(message, parse_mode="Markdown")
 
 async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Show top 10 users by streak."""
-    c.execute("""
-        SELECT username, MAX(streak) as max_streak 
-        FROM submissions 
-        GROUP BY user_id 
-        ORDER BY max_streak DESC 
-        LIMIT 10
-    """)
-    leaders = c.fetchall()
+    with span("db.leaderboard"):
+        leaders = [(username, best_streak) for _, username, best_streak in get_leaderboard()]
     if leaders:
         message = "🏆 *SOLIDITY CHALLENGE LEADERBOARD* 🏆\n\n"
         
@@ -209,13 +334,71 @@ async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
                 message += f"{i}. *{streak} days* - {user_display}\n"
                 
         message += "\n💪 Keep building to climb the ranks! 💪"
-        await update.message.reply_text(message, parse_mode="Markdown")
+        with span("send.reply"):
+            await update.message.reply_text(message, parse_mode="Markdown")
     else:
+        with span("send.reply"):
+            await update.message.reply_text(
+                "📊 *LEADERBOARD EMPTY* 📊\n\n"
+                "Be the first to submit and claim the top spot!",
+                parse_mode="Markdown"
+            )
+
+def is_admin(update: Update) -> bool:
+    """Check whether the sender may run moderation commands."""
+    return update.effective_user is not None and update.effective_user.id in ADMIN_USER_IDS
+
+async def grace(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Grant a grace day to every member of a chat who missed it (admins only)."""
+    if not is_admin(update):
+        await update.message.reply_text("⛔ This command is for admins only.")
+        return
+    try:
+        day = date.fromisoformat(context.args[0])
+        chat_id = int(context.args[1]) if len(context.args) > 1 else update.effective_chat.id
+    except (IndexError, ValueError):
         await update.message.reply_text(
-            "📊 *LEADERBOARD EMPTY* 📊\n\n"
-            "Be the first to submit and claim the top spot!",
+            "*Correct Format:* `/grace <YYYY-MM-DD> [chat_id]`\n\n"
+            "Defaults to the current chat.",
             parse_mode="Markdown"
         )
+        return
+
+    if day >= datetime.now().date():
+        await update.message.reply_text("❌ Grace days can only be granted for past dates.")
+        return
+
+    conn = get_db()
+    with span("db.grace", chat_id=chat_id):
+        user_ids = admin.grant_grace(conn, day, chat_id)
+    refresh_after_correction(user_ids)
+    if not user_ids and not admin.has_chat_members(conn, chat_id):
+        await update.message.reply_text(
+            f"⚠️ No members are recorded for chat {chat_id} yet. "
+            "Members are added when they /submit there, so no grace day was granted."
+        )
+        return
+    await update.message.reply_text(f"✅ Granted a grace day for {day} to {len(user_ids)} user(s).")
+
+async def revert(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Delete a user's submissions from a date onwards (admins only)."""
+    if not is_admin(update):
+        await update.message.reply_text("⛔ This command is for admins only.")
+        return
+    try:
+        user_id = int(context.args[0])
+        since = date.fromisoformat(context.args[1])
+    except (IndexError, ValueError):
+        await update.message.reply_text(
+            "*Correct Format:* `/revert <user_id> <YYYY-MM-DD>`",
+            parse_mode="Markdown"
+        )
+        return
+
+    with span("db.revert", user_id=user_id):
+        removed = admin.revert_submissions(get_db(), user_id, since)
+    refresh_after_correction([user_id])
+    await update.message.reply_text(f"✅ Removed {removed} submission(s) of user {user_id} since {since}.")
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle all messages and check for GM."""
@@ -274,13 +457,18 @@ async def get_chat_id(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
 def get_challenge_details(day):
     """Fetch challenge details from the website"""
     try:
+        conn = get_db()
+        c = conn.cursor()
+
         # First check if we already have it in the database
         c.execute("SELECT title, description FROM daily_challenges WHERE day=?", (day,))
         result = c.fetchone()
         if result:
             return {"title": result[0], "description": result[1]}
             
-        # If not in database, try to fetch from website
+        # If not in database, try to fetch from website (rarely hit, so imported here)
+        import requests
+        from bs4 import BeautifulSoup
         response = requests.get(CHALLENGE_URL)
         if response.status_code == 200:
             soup = BeautifulSoup(response.text, 'html.parser')
@@ -300,7 +488,7 @@ def get_challenge_details(day):
         # If we couldn't get specific details, return generic info
         return {"title": f"Day {day} Challenge", "description": "Check the website for details!"}
     except Exception as e:
-        logging.error(f"Error fetching challenge details: {e}")
+        logging.error("Error fetching challenge details: %s", e)
         return {"title": f"Day {day} Challenge", "description": "Check the website for details!"}
 
 async def announce_daily_challenge(application):
@@ -335,6 +523,7 @@ async def announce_solution(application):
     current_day = (datetime.now(utc).date() - datetime(2025, 4, 1, tzinfo=utc).date()).days
     
     if 1 <= current_day <= 30:
+        c = get_db().cursor()
         c.execute("SELECT youtube_link FROM daily_challenges WHERE day=?", (current_day,))
         result = c.fetchone()
         youtube_link = result[0] if result and result[0] else "[Link coming soon]"
@@ -352,13 +541,23 @@ def main() -> None:
     # Initialize the application
     application = Application.builder().token(API_KEY).build()
 
+    # Run before every other handler: tag the update's logs, then pick up writes made by other processes
+    application.add_handler(TypeHandler(Update, set_correlation_id), group=-2)
+    application.add_handler(TypeHandler(Update, sync_caches), group=-1)
+
     # Add command handlers
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("submit", submit))
     application.add_handler(CommandHandler("streak", streak))
+    application.add_handler(CommandHandler("history", show_history))
+    application.add_handler(CommandHandler("calendar", calendar))
     application.add_handler(CommandHandler("leaderboard", leaderboard))
     application.add_handler(CommandHandler("chatid", get_chat_id))
 
+    # Admin-only moderation commands
+    application.add_handler(CommandHandler("grace", grace))
+    application.add_handler(CommandHandler("revert", revert))
+
     # Add message handler for all messages (including GM)
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     
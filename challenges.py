@@ -0,0 +1,180 @@
+import hashlib
+import json
+import logging
+from dataclasses import dataclass
+
+@dataclass(frozen=True, slots=True)
+class Challenge:
+    """One day of the challenge schedule, validated when the schedule is loaded."""
+    day: int
+    contract_name: str
+    week: str = ""
+    example_application: str = ""
+    concepts_taught: tuple = ()
+    logical_progression: str = ""
+    youtube_link: str = ""
+    solution_link: str = ""
+    content_hash: str = ""
+
+class ChallengeValidationError(ValueError):
+    """Raised when challenge content doesn't match the expected schema."""
+
+# JSON key -> (Challenge field, required)
+_STRING_FIELDS = {
+    "contractName": ("contract_name", True),
+    "week": ("week", False),
+    "exampleApplication": ("example_application", False),
+    "logicalProgression": ("logical_progression", False),
+    "youtubeLink": ("youtube_link", False),
+    "solutionLink": ("solution_link", False),
+}
+
+# Columns daily_challenges needs; older databases are migrated with ALTER TABLE
+_COLUMNS = {
+    "contract_name": "TEXT",
+    "week": "TEXT",
+    "example_application": "TEXT",
+    "concepts_json": "TEXT",
+    "logical_progression": "TEXT",
+    "youtube_link": "TEXT",
+    "solution_link": "TEXT",
+    "content_hash": "TEXT",
+    # Comma-separated concepts written by older versions, only read as a fallback
+    "concepts_taught": "TEXT",
+}
+
+# Compiled schedules by hash of the raw file, and challenges read from the DB by content hash
+_schedules = {}
+_from_db = {}
+
+def content_hash(value):
+    """Return a stable hash of JSON-serialisable content."""
+    return hashlib.sha256(json.dumps(value, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+def compile_challenge(raw):
+    """Validate one schedule entry and return it as a Challenge."""
+    if not isinstance(raw, dict):
+        raise ChallengeValidationError(f"expected an object, got {type(raw).__name__}")
+    errors = []
+
+    day = raw.get("day")
+    if not isinstance(day, int) or isinstance(day, bool) or day < 1:
+        errors.append(f"'day' must be a positive integer, got {day!r}")
+
+    fields = {}
+    for key, (field, required) in _STRING_FIELDS.items():
+        value = raw.get(key)
+        if value is None:
+            if required:
+                errors.append(f"'{key}' is required")
+        elif not isinstance(value, str):
+            errors.append(f"'{key}' must be a string, got {type(value).__name__}")
+        else:
+            fields[field] = value.strip()
+
+    concepts = raw.get("conceptsTaught", [])
+    if not isinstance(concepts, list) or not all(isinstance(concept, str) for concept in concepts):
+        errors.append("'conceptsTaught' must be a list of strings")
+        concepts = []
+
+    if errors:
+        raise ChallengeValidationError(f"day {day!r}: " + "; ".join(errors))
+    return Challenge(day=day, concepts_taught=tuple(concept.strip() for concept in concepts),
+                     content_hash=content_hash(raw), **fields)
+
+def compile_schedule(data):
+    """Validate a parsed challenges file and return {day: Challenge}.
+
+    All problems are collected and raised together as a ChallengeValidationError.
+    """
+    schedule = data.get("schedule") if isinstance(data, dict) else None
+    if not isinstance(schedule, list):
+        raise ChallengeValidationError("expected an object with a 'schedule' list")
+
+    challenges = {}
+    errors = []
+    for index, raw in enumerate(schedule):
+        try:
+            challenge = compile_challenge(raw)
+        except ChallengeValidationError as e:
+            errors.append(f"schedule[{index}]: {e}")
+            continue
+        if challenge.day in challenges:
+            errors.append(f"schedule[{index}]: duplicate day {challenge.day}")
+            continue
+        challenges[challenge.day] = challenge
+
+    if errors:
+        raise ChallengeValidationError("invalid challenges file:\n" + "\n".join(errors))
+    return challenges
+
+def load_schedule(raw_bytes):
+    """Parse and compile a challenges file, reusing the compiled result if the content is unchanged."""
+    file_hash = hashlib.sha256(raw_bytes).hexdigest()
+    if file_hash not in _schedules:
+        _schedules.clear()
+        _schedules[file_hash] = compile_schedule(json.loads(raw_bytes))
+    return _schedules[file_hash]
+
+def ensure_challenges_table(conn):
+    """Create daily_challenges, adding any columns missing from older databases."""
+    c = conn.cursor()
+    c.execute("CREATE TABLE IF NOT EXISTS daily_challenges (day INTEGER PRIMARY KEY)")
+    c.execute("PRAGMA table_info(daily_challenges)")
+    existing = {column[1] for column in c.fetchall()}
+    for column, column_type in _COLUMNS.items():
+        if column not in existing:
+            c.execute(f"ALTER TABLE daily_challenges ADD COLUMN {column} {column_type}")
+    conn.commit()
+
+def save_challenges(conn, challenges):
+    """Store challenges whose content hash differs from the stored row. Returns the number written."""
+    c = conn.cursor()
+    c.execute("SELECT day, content_hash FROM daily_challenges")
+    stored = dict(c.fetchall())
+    changed = [challenge for challenge in challenges if stored.get(challenge.day) != challenge.content_hash]
+    if not changed:
+        return 0
+
+    with conn:
+        conn.executemany('''INSERT INTO daily_challenges
+                            (day, contract_name, week, example_application, concepts_json, logical_progression,
+                             youtube_link, solution_link, content_hash)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                            ON CONFLICT(day) DO UPDATE SET
+                            contract_name=excluded.contract_name, week=excluded.week,
+                            example_application=excluded.example_application, concepts_json=excluded.concepts_json,
+                            logical_progression=excluded.logical_progression, youtube_link=excluded.youtube_link,
+                            solution_link=excluded.solution_link, content_hash=excluded.content_hash''',
+                         [(ch.day, ch.contract_name, ch.week, ch.example_application,
+                           json.dumps(ch.concepts_taught, ensure_ascii=False), ch.logical_progression,
+                           ch.youtube_link, ch.solution_link, ch.content_hash) for ch in changed])
+    logging.info("Saved %s changed challenge(s) to database", len(changed))
+    return len(changed)
+
+def load_challenge(conn, day):
+    """Return the stored Challenge for ``day``, or None."""
+    c = conn.cursor()
+    c.execute("SELECT content_hash FROM daily_challenges WHERE day=?", (day,))
+    row = c.fetchone()
+    if not row:
+        return None
+    if row[0] and row[0] in _from_db:
+        return _from_db[row[0]]
+
+    c.execute("SELECT contract_name, week, example_application, concepts_json, concepts_taught, "
+              "logical_progression, youtube_link, solution_link FROM daily_challenges WHERE day=?", (day,))
+    (contract_name, week, example_application, concepts_json, legacy_concepts,
+     logical_progression, youtube_link, solution_link) = c.fetchone()
+    if concepts_json:
+        concepts = tuple(json.loads(concepts_json))
+    else:
+        # Rows written before concepts were stored as JSON
+        concepts = tuple(legacy_concepts.split(",")) if legacy_concepts else ()
+    challenge = Challenge(day=day, contract_name=contract_name or f"Day {day} Challenge", week=week or "",
+                          example_application=example_application or "", concepts_taught=concepts,
+                          logical_progression=logical_progression or "", youtube_link=youtube_link or "",
+                          solution_link=solution_link or "", content_hash=row[0] or "")
+    if row[0]:
+        _from_db[row[0]] = challenge
+    return challenge
@@ -0,0 +1,131 @@
+import os
+from collections import OrderedDict
+from datetime import date, timedelta
+
+# Number of days shown by /history and /calendar
+HISTORY_DAYS = 30
+# Maximum number of rendered views kept in memory (override in .env)
+HISTORY_CACHE_SIZE = int(os.getenv("HISTORY_CACHE_SIZE", "2000"))
+
+SUBMITTED = "🟩"
+MISSED = "🟥"
+GRACE = "🟨"
+PENDING = "⬜"
+
+# (user_id, view) -> (day rendered for, text). Entries are dropped on the user's next submission.
+_rendered = OrderedDict()
+
+def ensure_history_index(conn):
+    """Create the index that turns a user's date window into a single range scan."""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_submissions_user_date ON submissions (user_id, submission_date)")
+    conn.commit()
+
+def fetch_window(conn, user_id, today, days=HISTORY_DAYS):
+    """Return {date: pr_link} for the user's submissions in the last ``days`` days.
+
+    Grace days granted by an admin have no PR link.
+    """
+    first_day = today - timedelta(days=days - 1)
+    c = conn.cursor()
+    c.execute("SELECT submission_date, pr_link FROM submissions "
+              "WHERE user_id=? AND submission_date BETWEEN ? AND ?",
+              (user_id, first_day.isoformat(), today.isoformat()))
+    return {date.fromisoformat(day): pr_link for day, pr_link in c.fetchall()}
+
+def _link_target(url):
+    """Percent-encode characters that would end or restyle a Markdown link.
+
+    /submit only stores canonical PR URLs, but older rows were checked by prefix only.
+    """
+    for char, encoded in (("(", "%28"), (")", "%29"), ("[", "%5B"), ("]", "%5D"),
+                          ("_", "%5F"), ("*", "%2A"), ("`", "%60"), (" ", "%20")):
+        url = url.replace(char, encoded)
+    return url
+
+def _window_days(today, days=HISTORY_DAYS):
+    return [today - timedelta(days=offset) for offset in range(days - 1, -1, -1)]
+
+def _summary(submissions):
+    """Count days with a PR; grace days are listed separately."""
+    grace_days = sum(1 for pr_link in submissions.values() if not pr_link)
+    summary = f"Submitted on *{len(submissions) - grace_days}/{HISTORY_DAYS}* days"
+    if grace_days:
+        summary += f" (+{grace_days} grace)"
+    return summary
+
+def render_calendar(submissions, today):
+    """Render a weekday-aligned grid of the last HISTORY_DAYS days.
+
+    Like /history, it starts at the first submission in the window; earlier days are left blank.
+    """
+    days = _window_days(today)
+    first = min(submissions) if submissions else today
+    cells = ["  "] * days[0].weekday()
+    for day in days:
+        if day < first:
+            cells.append("  ")
+        elif day in submissions:
+            cells.append(SUBMITTED if submissions[day] else GRACE)
+        elif day == today:
+            cells.append(PENDING)
+        else:
+            cells.append(MISSED)
+
+    # Inside a code block an emoji takes two columns, the same as a weekday label
+    rows = [" ".join(cells[i:i + 7]).rstrip() for i in range(0, len(cells), 7)]
+    return (f"📅 *STREAK CALENDAR* 📅\n"
+            f"{days[0].strftime('%b %d')} - {today.strftime('%b %d')}\n\n"
+            f"```\nMo Tu We Th Fr Sa Su\n"
+            + "\n".join(rows) +
+            f"\n```\n{SUBMITTED} submitted  {MISSED} missed  {GRACE} grace  {PENDING} today\n"
+            + _summary(submissions))
+
+def render_history(submissions, today):
+    """Render the last HISTORY_DAYS days, newest first, from the first submission in the window."""
+    if not submissions:
+        return ("📜 *SUBMISSION HISTORY* 📜\n\n"
+                f"No submissions in the last {HISTORY_DAYS} days.\n"
+                f"Submit with `/submit <github_pr_link>` to start your streak!")
+
+    first = min(submissions)
+    lines = []
+    for day in reversed(_window_days(today)):
+        if day < first:
+            break
+        if day in submissions and not submissions[day]:
+            lines.append(f"{GRACE} {day.strftime('%b %d')} - grace day")
+        elif day in submissions:
+            lines.append(f"{SUBMITTED} {day.strftime('%b %d')} - [PR]({_link_target(submissions[day])})")
+        elif day == today:
+            lines.append(f"{PENDING} {day.strftime('%b %d')} - not submitted yet")
+        else:
+            lines.append(f"{MISSED} {day.strftime('%b %d')} - missed")
+    return ("📜 *SUBMISSION HISTORY* 📜\n\n"
+            + "\n".join(lines) +
+            "\n\n" + _summary(submissions))
+
+def get_rendered(conn, user_id, view, today):
+    """Return the rendered ``view`` ('calendar' or 'history'), using the cache when possible."""
+    key = (user_id, view)
+    cached = _rendered.get(key)
+    if cached and cached[0] == today:
+        _rendered.move_to_end(key)
+        return cached[1]
+
+    submissions = fetch_window(conn, user_id, today)
+    render = render_calendar if view == "calendar" else render_history
+    text = render(submissions, today)
+    _rendered[key] = (today, text)
+    _rendered.move_to_end(key)
+    if len(_rendered) > HISTORY_CACHE_SIZE:
+        _rendered.popitem(last=False)
+    return text
+
+def invalidate(user_id):
+    """Forget the user's rendered views, e.g. after a new submission."""
+    _rendered.pop((user_id, "calendar"), None)
+    _rendered.pop((user_id, "history"), None)
+
+def clear():
+    """Forget every rendered view."""
+    _rendered.clear()
@@ -0,0 +1,108 @@
+import asyncio
+import cProfile
+import functools
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from log_config import correlation_id
+
+# Jobs to profile on every run: comma-separated job ids, or "all" (override in .env)
+PROFILE_JOBS = {job_id.strip() for job_id in os.getenv("PROFILE_JOBS", "").split(",") if job_id.strip()}
+# Where .prof files are written. Creating <PROFILE_DIR>/<job_id>.request profiles that job's next run only.
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# Alert when a run takes more than this fraction of the gap before the next scheduled job
+JOB_ALERT_RATIO = float(os.getenv("JOB_ALERT_RATIO", "0.5"))
+
+# Broadcast jobs hold this lock while they run, so they never overlap each other
+_job_lock = asyncio.Lock()
+
+def _should_profile(job_id):
+    """Check whether this run should be profiled, consuming a one-shot request file."""
+    request_file = os.path.join(PROFILE_DIR, f"{job_id}.request")
+    try:
+        os.remove(request_file)
+        return True
+    except FileNotFoundError:
+        pass
+    return "all" in PROFILE_JOBS or job_id in PROFILE_JOBS
+
+def _next_job_start(scheduler):
+    """Return when the next scheduled job is due, or None."""
+    next_runs = [job.next_run_time for job in scheduler.get_jobs() if job.next_run_time]
+    return min(next_runs) if next_runs else None
+
+def _check_gap(job_id, wall, waited, dispatched_at, next_start, on_alert):
+    """Alert if a run overlapped the next scheduled job or used too much of the gap before it."""
+    gap = (next_start - dispatched_at).total_seconds()
+    overrun = (datetime.now(timezone.utc) - next_start).total_seconds()
+    if overrun > 0:
+        message = (f"Job {job_id} ran {overrun:.0f}s past the start of the next scheduled job "
+                   f"(took {wall:.1f}s after waiting {waited:.1f}s; the gap was {gap:.0f}s)")
+    elif wall > JOB_ALERT_RATIO * gap:
+        message = (f"Job {job_id} took {wall:.1f}s, {wall / gap:.0%} of the "
+                   f"{gap:.0f}s before the next scheduled job")
+    else:
+        return
+    logging.warning(message, extra={"event": "job.slow", "job_id": job_id, "gap_s": gap,
+                                    "overrun_s": max(overrun, 0)})
+    if on_alert:
+        on_alert(job_id, message)
+
+def monitored(scheduler, job_id, func, overlap="wait", on_alert=None):
+    """Wrap a job coroutine with overlap handling, timing and optional profiling.
+
+    overlap is "wait" (queue behind the running job) or "skip" (drop this run
+    if another job is running). on_alert(job_id, message) is called when a run gets
+    close to the next scheduled job or runs past its start.
+
+    The profile covers everything the event loop ran during the job, including
+    background tasks such as the outbox worker.
+    """
+    @functools.wraps(func)
+    async def run(*args):
+        if overlap == "skip" and _job_lock.locked():
+            logging.warning("Skipping job %s: another job is still running", job_id)
+            return
+
+        # Look up the next job at dispatch: once it has started, its next_run_time
+        # already points at its following run
+        dispatched_at = datetime.now(timezone.utc)
+        next_start = _next_job_start(scheduler)
+
+        async with _job_lock:
+            started_at = datetime.now(timezone.utc)
+            waited = (started_at - dispatched_at).total_seconds()
+            correlation_id.set(f"job-{job_id}-{started_at.strftime('%Y%m%dT%H%M%S')}")
+            profiler = cProfile.Profile() if _should_profile(job_id) else None
+            wall_start = time.perf_counter()
+            cpu_start = time.process_time()
+            if profiler:
+                profiler.enable()
+            try:
+                await func(*args)
+            finally:
+                if profiler:
+                    profiler.disable()
+                wall = time.perf_counter() - wall_start
+                cpu = time.process_time() - cpu_start
+
+                # Bookkeeping must never fail a successful job or replace the job's own exception
+                try:
+                    if profiler:
+                        os.makedirs(PROFILE_DIR, exist_ok=True)
+                        path = os.path.join(PROFILE_DIR, f"{job_id}-{started_at.strftime('%Y%m%dT%H%M%S')}.prof")
+                        profiler.dump_stats(path)
+                        logging.info("Saved profile for job %s to %s", job_id, path)
+
+                    logging.info("Job %s finished in %.2fs wall, %.2fs CPU (waited %.2fs to start)", job_id, wall,
+                                 cpu, waited, extra={"event": "job.finished", "job_id": job_id,
+                                                     "wall_s": round(wall, 3), "cpu_s": round(cpu, 3),
+                                                     "waited_s": round(waited, 3)})
+
+                    if next_start:
+                        _check_gap(job_id, wall, waited, dispatched_at, next_start, on_alert)
+                except Exception:
+                    logging.exception("Recording the run of job %s failed", job_id)
+
+    return run
@@ -0,0 +1,119 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Log level and output format ("json" or "text" for local debugging) (override in .env)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# Keep 1 in N records of high-volume events, e.g. "outbox.delivered=50,span=10".
+# Spans can also be sampled by name, e.g. "span.send.outbox=20"; spans without a rate are logged at DEBUG.
+LOG_SAMPLE = os.getenv("LOG_SAMPLE", "outbox.delivered=20,span.send.outbox=20,span.send.reply=20")
+
+# Identifies the Telegram update, scheduler run or outbox message being processed
+correlation_id = ContextVar("correlation_id", default="-")
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+class JsonFormatter(logging.Formatter):
+    """Format a record as one JSON object per line, including its ``extra`` fields."""
+
+    converter = time.gmtime
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "correlation_id": getattr(record, "correlation_id", "-"),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key not in entry:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class ContextFilter(logging.Filter):
+    """Attach the current correlation id and drop sampled-out records of high-volume events."""
+
+    def __init__(self, sample_rates):
+        super().__init__()
+        self.sample_rates = sample_rates
+        self._counters = {}
+
+    def filter(self, record):
+        record.correlation_id = correlation_id.get()
+        event = getattr(record, "event", None)
+        if event == "span" and f"span.{record.span}" in self.sample_rates:
+            event = f"span.{record.span}"
+        rate = self.sample_rates.get(event)
+        if rate and rate > 1:
+            count = self._counters.get(event, 0)
+            self._counters[event] = count + 1
+            if count % rate:
+                return False
+            record.sampled = f"1/{rate}"
+        return True
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    """Queue records unformatted so message formatting happens on the listener thread."""
+
+    def prepare(self, record):
+        return record
+
+def _parse_sample_rates(spec):
+    rates = {}
+    for item in spec.split(","):
+        if "=" in item:
+            event, rate = item.split("=", 1)
+            rates[event.strip()] = int(rate)
+    return rates
+
+_sample_rates = _parse_sample_rates(LOG_SAMPLE)
+
+def setup_logging():
+    """Route all logging through a queue so the calling thread (the event loop) never blocks on I/O."""
+    stream = logging.StreamHandler()
+    if LOG_FORMAT == "text":
+        stream.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - [%(correlation_id)s] %(message)s'))
+    else:
+        stream.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    handler = _LazyQueueHandler(log_queue)
+    handler.addFilter(ContextFilter(_sample_rates))
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(LOG_LEVEL)
+    # httpx logs every Telegram API request at INFO; send timings come from spans instead
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    listener = logging.handlers.QueueListener(log_queue, stream)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+@contextmanager
+def span(name, **fields):
+    """Log the duration of a block under the current correlation id.
+
+    Records have event "span". They are logged at INFO, 1 in N, when LOG_SAMPLE
+    has a rate for "span" or "span.<name>", and at DEBUG otherwise.
+    """
+    level = logging.INFO if f"span.{name}" in _sample_rates or "span" in _sample_rates else logging.DEBUG
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000
+        logging.log(level, "%s took %.1fms", name, duration_ms,
+                    extra={"event": "span", "span": name, "duration_ms": round(duration_ms, 2), **fields})
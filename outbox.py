@@ -0,0 +1,182 @@
+"""Persistent outbox for scheduled broadcasts.
+
+Jobs queue messages here and a single worker delivers them, rate limited and
+with retries. Delivery is at-least-once only in one narrow window: if the
+process dies after Telegram accepted a message but before it is marked sent,
+that message is sent again on restart. A send that times out may or may not
+have arrived, so it is never retried automatically; it is marked 'unknown'
+for an admin to check.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from datetime import timedelta
+from telegram.error import BadRequest, Forbidden, RetryAfter, TimedOut
+from log_config import correlation_id, span
+
+# Delivery tuning (override in .env)
+# OUTBOX_RATE is messages per second; Telegram allows roughly 30/s per bot across chats
+OUTBOX_RATE = int(os.getenv("OUTBOX_RATE", "25"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "2"))
+# Base delay for exponential backoff between retries, in seconds
+OUTBOX_RETRY_BASE = float(os.getenv("OUTBOX_RETRY_BASE", "30"))
+# How often recording a delivered message is retried while the database is locked
+OUTBOX_MARK_SENT_ATTEMPTS = 5
+
+# Database setup (opened on first use so importing the module stays cheap)
+_conn = None
+
+def get_db():
+    """Return the database connection, creating the outbox table on first use."""
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect('submissions.db')
+        c = _conn.cursor()
+
+        # Create outbox table. status is one of 'pending', 'sent', 'dead' or 'unknown'
+        # (the send timed out, so the message may or may not have been delivered).
+        # idempotency_key is unique so re-running a job never queues the same message twice.
+        c.execute('''CREATE TABLE IF NOT EXISTS outbox
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT, idempotency_key TEXT UNIQUE NOT NULL,
+                      chat_id INTEGER NOT NULL, text TEXT NOT NULL, parse_mode TEXT,
+                      status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0,
+                      next_attempt_at REAL NOT NULL, last_error TEXT, created_at REAL NOT NULL, sent_at REAL)''')
+        c.execute('''CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at)''')
+        _conn.commit()
+    return _conn
+
+def enqueue_broadcast(key, chat_ids, text, parse_mode="Markdown"):
+    """Queue one message per chat in a single transaction.
+
+    Each row gets the key ``<key>:<chat_id>``; keys that are already queued are
+    ignored, so a job that is re-run after a crash does not produce duplicates.
+    Returns the number of newly queued messages.
+    """
+    now = time.time()
+    rows = [(f"{key}:{chat_id}", chat_id, text, parse_mode, now, now) for chat_id in chat_ids]
+    conn = get_db()
+    with conn:
+        cur = conn.executemany(
+            "INSERT OR IGNORE INTO outbox (idempotency_key, chat_id, text, parse_mode, next_attempt_at, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)", rows)
+    queued = cur.rowcount if cur.rowcount is not None else 0
+    logging.info("Queued %s message(s) for %s (%s already queued)", queued, key, len(rows) - queued,
+                 extra={"event": "outbox.queued", "key": key, "queued": queued})
+    return queued
+
+async def _mark_sent(message_id):
+    """Record a delivered message, retrying while another process holds the database lock.
+
+    If it still can't be recorded the row stays pending and will be sent again.
+    """
+    conn = get_db()
+    for attempt in range(1, OUTBOX_MARK_SENT_ATTEMPTS + 1):
+        try:
+            with conn:
+                conn.execute("UPDATE outbox SET status='sent', sent_at=? WHERE id=?", (time.time(), message_id))
+            return
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e) or attempt == OUTBOX_MARK_SENT_ATTEMPTS:
+                logging.error("Could not mark outbox message %s as sent, it may be sent again: %s", message_id, e,
+                              extra={"event": "outbox.unrecorded", "message_id": message_id})
+                return
+            await asyncio.sleep(0.5 * attempt)
+
+def _mark_unknown(message_id, attempts, error):
+    """Park a message whose send timed out; it may already have been delivered."""
+    conn = get_db()
+    with conn:
+        conn.execute("UPDATE outbox SET status='unknown', attempts=?, last_error=? WHERE id=?",
+                     (attempts + 1, str(error), message_id))
+    logging.error("Outbox message %s timed out and may or may not have been delivered; not retrying: %s",
+                  message_id, error, extra={"event": "outbox.unknown", "message_id": message_id})
+
+def _mark_failed(message_id, attempts, error, retry_in=None, permanent=False):
+    """Schedule a retry with exponential backoff, or dead-letter the message."""
+    attempts += 1
+    conn = get_db()
+    if permanent or attempts >= OUTBOX_MAX_ATTEMPTS:
+        with conn:
+            conn.execute("UPDATE outbox SET status='dead', attempts=?, last_error=? WHERE id=?",
+                         (attempts, str(error), message_id))
+        logging.error("Dead-lettered outbox message %s after %s attempt(s): %s", message_id, attempts, error,
+                      extra={"event": "outbox.dead", "message_id": message_id, "attempts": attempts})
+        return
+    if retry_in is None:
+        retry_in = OUTBOX_RETRY_BASE * (2 ** (attempts - 1))
+    with conn:
+        conn.execute("UPDATE outbox SET attempts=?, last_error=?, next_attempt_at=? WHERE id=?",
+                     (attempts, str(error), time.time() + retry_in, message_id))
+    logging.warning("Outbox message %s failed (attempt %s), retrying in %.0fs: %s", message_id, attempts, retry_in, error,
+                    extra={"event": "outbox.retry", "message_id": message_id, "attempts": attempts})
+
+async def _deliver(bot, row):
+    """Send a single outbox row and record the outcome."""
+    message_id, key, chat_id, text, parse_mode, attempts = row
+    # Runs in its own task, so this only tags logs of this delivery
+    correlation_id.set(key)
+    try:
+        with span("send.outbox", chat_id=chat_id):
+            await bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode)
+    except RetryAfter as e:
+        # Flood control: don't count it as a failed attempt, just wait as instructed
+        delay = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else e.retry_after
+        conn = get_db()
+        with conn:
+            conn.execute("UPDATE outbox SET next_attempt_at=? WHERE id=?", (time.time() + delay, message_id))
+        logging.warning("Flood control hit for chat %s, retrying in %ss", chat_id, delay,
+                        extra={"event": "outbox.flood_control", "chat_id": chat_id})
+        return
+    except TimedOut as e:
+        # The request may have reached Telegram, so a retry could post the message twice
+        _mark_unknown(message_id, attempts, e)
+        return
+    except (Forbidden, BadRequest) as e:
+        # Bot was removed from the chat, chat doesn't exist or the message is malformed.
+        # Retrying won't help.
+        _mark_failed(message_id, attempts, e, permanent=True)
+        return
+    except Exception as e:
+        _mark_failed(message_id, attempts, e)
+        return
+    await _mark_sent(message_id)
+    # One line per chat per broadcast, sampled via LOG_SAMPLE
+    logging.info("Delivered outbox message %s to chat %s", message_id, chat_id,
+                 extra={"event": "outbox.delivered", "message_id": message_id, "chat_id": chat_id})
+
+async def drain(bot):
+    """Deliver every message that is currently due, at most OUTBOX_RATE per second.
+
+    Returns the number of messages attempted.
+    """
+    attempted = 0
+    c = get_db().cursor()
+    while True:
+        window_start = time.monotonic()
+        c.execute("SELECT id, idempotency_key, chat_id, text, parse_mode, attempts FROM outbox "
+                  "WHERE status='pending' AND next_attempt_at<=? ORDER BY id LIMIT ?",
+                  (time.time(), OUTBOX_RATE))
+        batch = c.fetchall()
+        if not batch:
+            return attempted
+
+        # Messages go to different chats, so a window's worth can be sent concurrently
+        await asyncio.gather(*(_deliver(bot, row) for row in batch))
+        attempted += len(batch)
+
+        elapsed = time.monotonic() - window_start
+        if elapsed < 1:
+            await asyncio.sleep(1 - elapsed)
+
+async def run_worker(bot):
+    """Drain the outbox forever. Pending messages left over from a previous run are picked up first."""
+    logging.info("Outbox worker started (rate=%s/s, max attempts=%s)", OUTBOX_RATE, OUTBOX_MAX_ATTEMPTS)
+    while True:
+        try:
+            await drain(bot)
+        except Exception as e:
+            logging.error("Outbox worker error: %s", e)
+        await asyncio.sleep(OUTBOX_POLL_INTERVAL)
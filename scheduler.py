@@ -1,37 +1,37 @@
 import asyncio
 import logging
 import os
-import json
-from datetime import datetime
-import pytz
-import requests
-from bs4 import BeautifulSoup
+from datetime import datetime, timezone
 import sqlite3
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from telegram.ext import Application
 from dotenv import load_dotenv
 
+# Load environment variables (before the modules below read their settings)
+load_dotenv()
+
+import challenges
+import outbox
+from job_monitor import monitored
+from log_config import setup_logging
+
 # Enable logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+setup_logging()
 
-# Load environment variables
-load_dotenv()
 API_KEY = os.getenv("API_KEY")
 
 # Support for multiple group chat IDs (comma-separated in .env)
 group_chat_ids_str = os.getenv("GROUP_CHAT_ID", "")
 GROUP_CHAT_IDS = [int(chat_id.strip()) for chat_id in group_chat_ids_str.split(",") if chat_id.strip()]
 
+# Admins receive job duration alerts in their private chat with the bot (comma-separated in .env)
+admin_user_ids_str = os.getenv("ADMIN_USER_IDS", "")
+ADMIN_USER_IDS = [int(user_id.strip()) for user_id in admin_user_ids_str.split(",") if user_id.strip()]
+
 # Constants
 CHALLENGE_URL = "https://web3compass.xyz/challenge-calendar"
 # Replace this with your GitHub raw content URL once you've uploaded the file
 CHALLENGES_JSON_URL = "https://raw.githubusercontent.com/SethuRamanOmanakuttan/challenge-data-solution/refs/heads/main/challenges.json"
-# Local fallback file
-LOCAL_CHALLENGES_FILE = "challenges.json"
-utc = pytz.UTC
+utc = timezone.utc
 
 # Predefined challenges as a fallback if both GitHub and local file fail
 PREDEFINED_CHALLENGES = {
@@ -59,103 +59,82 @@ PREDEFINED_CHALLENGES = {
     # These are only used as a last resort
 }
 
-# Database setup
-conn = sqlite3.connect('submissions.db')
-c = conn.cursor()
+# Database setup (opened on first use so importing the module stays cheap)
+_conn = None
 
-# Create daily challenges table if not exists
-c.execute('''CREATE TABLE IF NOT EXISTS daily_challenges
-             (day INTEGER PRIMARY KEY, contract_name TEXT, week TEXT, example_application TEXT, 
-              concepts_taught TEXT, logical_progression TEXT, youtube_link TEXT)''')
-conn.commit()
+def get_db():
+    """Return the database connection, creating the tables on first use."""
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect('submissions.db')
 
-def load_challenges_from_json():
-    """Load challenges from GitHub or local JSON file"""
-    challenges_by_day = {}
-    
-    #Try to fetch from GitHub first
+        # Create (or migrate) the daily challenges table
+        challenges.ensure_challenges_table(_conn)
+    return _conn
+
+_predefined = None
+
+def get_predefined_challenges():
+    """Return PREDEFINED_CHALLENGES compiled to Challenge objects."""
+    global _predefined
+    if _predefined is None:
+        _predefined = challenges.compile_schedule(
+            {"schedule": [dict(challenge, day=day) for day, challenge in PREDEFINED_CHALLENGES.items()]})
+    return _predefined
+
+def fetch_challenges():
+    """Fetch and compile challenges from GitHub. Returns {day: Challenge}, or None if unavailable or invalid."""
     try:
-        logging.info(f"Attempting to fetch challenges from GitHub: {CHALLENGES_JSON_URL}")
+        import requests
+        logging.info("Attempting to fetch challenges from GitHub: %s", CHALLENGES_JSON_URL)
         response = requests.get(CHALLENGES_JSON_URL, timeout=10)
         if response.status_code == 200:
-            challenges_data = response.json()
-            logging.info(f"Successfully loaded challenges from GitHub")
-            
-            # Convert to dictionary by day for easy lookup
-            for challenge in challenges_data.get("schedule", []):
-                day = challenge.get("day")
-                if day:
-                    challenges_by_day[day] = challenge
-            
-            return challenges_by_day
+            # Parsing and validation are skipped when the file hasn't changed since the last fetch
+            schedule = challenges.load_schedule(response.content)
+            logging.info("Successfully loaded challenges from GitHub")
+            return schedule
+    except challenges.ChallengeValidationError as e:
+        logging.error("Challenges from GitHub failed validation: %s", e)
     except Exception as e:
-        logging.error(f"Error fetching challenges from GitHub: {e}")
-    
-    # If GitHub fails, try local file
-    # try:
-    #     logging.info(f"Attempting to load challenges from local file: {LOCAL_CHALLENGES_FILE}")
-    #     with open(LOCAL_CHALLENGES_FILE, 'r') as f:
-    #         challenges_data = json.load(f)
-    #         logging.info(f"Successfully loaded challenges from local file")
-            
-    #         # Convert to dictionary by day for easy lookup
-    #         for challenge in challenges_data.get("schedule", []):
-    #             day = challenge.get("day")
-    #             if day:
-    #                 challenges_by_day[day] = challenge
-            
-    #         return challenges_by_day
-    # except Exception as e:
-    #     logging.error(f"Error loading challenges from local file: {e}")
-    
-    # If all else fails, return predefined challenges
-    logging.warning("Using predefined challenges as fallback")
-    return PREDEFINED_CHALLENGES
+        logging.error("Error fetching challenges from GitHub: %s", e)
+    return None
 
-# Load challenges when the module is imported
-ALL_CHALLENGES = load_challenges_from_json()
+def get_challenge(day):
+    """Return the Challenge for a day from GitHub, the database or the predefined fallback, or None"""
+    conn = get_db()
+
+    # GitHub content is authoritative; rows whose content hash is unchanged are not rewritten
+    schedule = fetch_challenges()
+    if schedule is not None:
+        challenges.save_challenges(conn, schedule.values())
+        if day in schedule:
+            logging.info("Using challenge from JSON for day %s", day)
+            return schedule[day]
+
+    # Otherwise use what was stored the last time GitHub was reachable
+    challenge = challenges.load_challenge(conn, day)
+    if challenge:
+        logging.info("Found challenge for day %s in database", day)
+        return challenge
+
+    return get_predefined_challenges().get(day)
 
 def get_challenge_details(day):
     """Fetch challenge details from JSON, database, or website"""
     try:
-        
-        ALL_CHALLENGES = load_challenges_from_json()
-        # First check if we already have it in the database
-        c.execute("SELECT contract_name, week, example_application, concepts_taught, logical_progression FROM daily_challenges WHERE day=?", (day,))
-        result = c.fetchone()
-        if result:
-            logging.info(f"Found challenge for day {day} in database")
-            challenge = {
-                "contractName": result[0],
-                "week": result[1],
-                "exampleApplication": result[2]
-            }
-            if result[3]:  # If concepts are stored
-                challenge["conceptsTaught"] = result[3].split(",")
-            if result[4]:
-                challenge["logicalProgression"] = result[4]
-            return challenge
-        
-        # Check if we have the challenge in our loaded challenges
-        if day in ALL_CHALLENGES:
-            logging.info(f"Using challenge from JSON for day {day}")
-            challenge = ALL_CHALLENGES[day]
-            
-            # Store in database for future use
-            concepts_str = ",".join(challenge.get("conceptsTaught", []))
-            c.execute("INSERT INTO daily_challenges (day, contract_name, week, example_application, concepts_taught, logical_progression) VALUES (?, ?, ?, ?, ?, ?)",
-                    (day, challenge.get("contractName", ""), challenge.get("week", ""), challenge.get("exampleApplication", ""), 
-                     concepts_str, challenge.get("logicalProgression", "")))
-            conn.commit()
-            logging.info(f"Saved JSON challenge for day {day} to database")
-            
+        challenge = get_challenge(day)
+        if challenge:
             return challenge
         
         # If not in database or JSON, try to fetch from website as a last resort
-        logging.info(f"Challenge for day {day} not found in database or JSON, fetching from website")
+        logging.info("Challenge for day %s not found in database or JSON, fetching from website", day)
         
         try:
-            logging.info(f"Attempting to fetch challenge details for day {day} from website")
+            # Only needed for this last-resort path, so imported here
+            import requests
+            from bs4 import BeautifulSoup
+
+            logging.info("Attempting to fetch challenge details for day %s from website", day)
             response = requests.get(CHALLENGE_URL, timeout=15)
             
             if response.status_code == 200:
@@ -170,7 +149,7 @@ def get_challenge_details(day):
                 day_headings = soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6'])
                 for heading in day_headings:
                     if f"Day {day}" in heading.text or f"DAY {day}" in heading.text:
-                        logging.info(f"Found heading: {heading.text}")
+                        logging.info("Found heading: %s", heading.text)
                         day_sections.append(heading)
                 
                 # Look for sections or divs with day info
@@ -178,7 +157,7 @@ def get_challenge_details(day):
                 for section in sections:
                     if f"Day {day}" in section.text or f"DAY {day}" in section.text:
                         if len(section.text) > 100:  # Only consider substantial sections
-                            logging.info(f"Found section containing Day {day}")
+                            logging.info("Found section containing Day %s", day)
                             day_sections.append(section)
                 
                 # If we found any day-specific sections, try to extract title and description
@@ -194,7 +173,7 @@ def get_challenge_details(day):
                         title = f"Day {day} Challenge"
                         if title_elem:
                             title = title_elem.text.strip()
-                            logging.info(f"Extracted title: {title}")
+                            logging.info("Extracted title: %s", title)
                         
                         # Try to extract description
                         description = ""
@@ -218,7 +197,7 @@ def get_challenge_details(day):
                         
                         description = description.strip()
                         if description:
-                            logging.info(f"Extracted description (first 100 chars): {description[:100]}...")
+                            logging.info("Extracted description (first 100 chars): %.100s...", description)
                             
                             # Try to extract concepts
                             concepts = []
@@ -231,29 +210,24 @@ def get_challenge_details(day):
                                         concepts.append(item.text.strip())
                             
                             # Save to database
-                            concepts_str = ",".join(concepts)
-                            c.execute("INSERT INTO daily_challenges (day, title, description, concepts) VALUES (?, ?, ?, ?)",
-                                    (day, title, description, concepts_str))
-                            conn.commit()
-                            logging.info(f"Saved challenge for day {day} to database")
+                            challenge = challenges.Challenge(
+                                day=day, contract_name=title, example_application=description,
+                                concepts_taught=tuple(concepts),
+                                content_hash=challenges.content_hash([title, description, concepts]))
+                            challenges.save_challenges(get_db(), [challenge])
+                            logging.info("Saved challenge for day %s to database", day)
                             
-                            return {"title": title, "description": description, "concepts": concepts}
+                            return challenge
         
         except Exception as web_error:
-            logging.error(f"Error fetching from website: {web_error}")
+            logging.error("Error fetching from website: %s", web_error)
         
-        # If we couldn't extract from the website, return a message directing to the website
-        logging.warning(f"Could not extract challenge details for day {day} from website")
-        return {
-            "title": f"Day {day} Challenge", 
-            "description": f"Today's challenge is now live! Visit {CHALLENGE_URL} to view the full details.\n\nSubmit your solution using /submit <GitHub_PR_link> when you're done!"
-        }
+        # If we couldn't extract from the website, announce it generically and point to the website
+        logging.warning("Could not extract challenge details for day %s from website", day)
+        return challenges.Challenge(day=day, contract_name=f"Day {day} Challenge")
     except Exception as e:
-        logging.error(f"Unexpected error in get_challenge_details: {e}")
-        return {
-            "title": f"Day {day} Challenge", 
-            "description": f"Today's challenge is now live! Visit {CHALLENGE_URL} to view the full details.\n\nSubmit your solution using /submit <GitHub_PR_link> when you're done!"
-        }
+        logging.error("Unexpected error in get_challenge_details: %s", e)
+        return challenges.Challenge(day=day, contract_name=f"Day {day} Challenge")
 
 async def announce_daily_challenge(application):
     """Announce the daily challenge at 12 AM UTC"""
@@ -265,28 +239,28 @@ async def announce_daily_challenge(application):
         if challenge:
             # Format concepts if available
             concepts_text = ""
-            if 'conceptsTaught' in challenge and challenge['conceptsTaught']:
+            if challenge.concepts_taught:
                 concepts_text = "🔍 *Concepts You'll Master:*\n"
-                for concept in challenge['conceptsTaught']:
+                for concept in challenge.concepts_taught:
                     concepts_text += f"• {concept}\n"
                 concepts_text += "\n"
             
             # Get week information
-            week_text = f"📅 *{challenge.get('week', '')}*\n\n" if 'week' in challenge else ""
+            week_text = f"📅 *{challenge.week}*\n\n" if challenge.week else ""
             
             # Get example application
             example_text = ""
-            if 'exampleApplication' in challenge and challenge['exampleApplication']:
-                example_text = f"🔎 *Example Application:*\n{challenge['exampleApplication']}\n\n"
+            if challenge.example_application:
+                example_text = f"🔎 *Example Application:*\n{challenge.example_application}\n\n"
             
             # Get logical progression
             progression_text = ""
-            if 'logicalProgression' in challenge and challenge['logicalProgression']:
-                progression_text = f"📈 *Learning Progression:*\n{challenge['logicalProgression']}\n\n"
+            if challenge.logical_progression:
+                progression_text = f"📈 *Learning Progression:*\n{challenge.logical_progression}\n\n"
             
             message = (f"💥 *DAY {current_day} CHALLENGE IS LIVE!* 💥\n\n"
                       f"{week_text}"
-                      f"📌 *Today's Challenge:* {challenge.get('contractName', f'Day {current_day} Challenge')}\n\n"
+                      f"📌 *Today's Challenge:* {challenge.contract_name}\n\n"
                       f"{example_text}"
                       f"{concepts_text}"
                       f"{progression_text}"
@@ -294,13 +268,8 @@ async def announce_daily_challenge(application):
                       f"👉 Submit your solution using `/submit <GitHub_PR_link>`\n\n"
                       f"💪 Let's crush this challenge together, builders!")
             
-            # Send to all configured groups
-            for chat_id in GROUP_CHAT_IDS:
-                try:
-                    await application.bot.send_message(chat_id=chat_id, text=message, parse_mode="Markdown")
-                    logging.info(f"Sent daily challenge announcement to chat {chat_id}")
-                except Exception as e:
-                    logging.error(f"Failed to send announcement to chat {chat_id}: {e}")
+            # Queue for all configured groups, the outbox worker delivers them
+            outbox.enqueue_broadcast(f"daily-challenge:{datetime.now(utc).date()}", GROUP_CHAT_IDS, message)
 
 async def send_reminder(application):
     """Send reminder 3 hours before deadline"""
@@ -309,13 +278,8 @@ async def send_reminder(application):
                "💻 Don't break your streak! Submit your solution using `/submit <GitHub_PR_link>`\n\n"
                "💡 Tip: Even a simple solution is better than missing a day!")
     
-    # Send to all configured groups
-    for chat_id in GROUP_CHAT_IDS:
-        try:
-            await application.bot.send_message(chat_id=chat_id, text=message, parse_mode="Markdown")
-            logging.info(f"Sent reminder to chat {chat_id}")
-        except Exception as e:
-            logging.error(f"Failed to send reminder to chat {chat_id}: {e}")
+    # Queue for all configured groups, the outbox worker delivers them
+    outbox.enqueue_broadcast(f"reminder:{datetime.now(utc).date()}", GROUP_CHAT_IDS, message)
 
 
 async def Web3ResourceMessage(application):
@@ -332,13 +296,8 @@ async def Web3ResourceMessage(application):
 
     current_day = (datetime.now(utc).date() - datetime(2025, 6, 1, tzinfo=utc).date()).days + 1
     if current_day == 1:
-    # Send to all configured groups
-        for chat_id in GROUP_CHAT_IDS:
-            try:
-                await application.bot.send_message(chat_id=chat_id, text=message, parse_mode="Markdown")
-                logging.info(f"Sent reminder to chat {chat_id}")
-            except Exception as e:
-                logging.error(f"Failed to send reminder to chat {chat_id}: {e}")
+        # Queue for all configured groups, the outbox worker delivers them
+        outbox.enqueue_broadcast(f"web3-resources:{datetime.now(utc).date()}", GROUP_CHAT_IDS, message)
 
 # async def announce_solution(application):
 #     """Announce that solution is live"""
@@ -370,23 +329,20 @@ async def announce_solution(application):
     """Announce that solution is live"""
     # Calculate previous day (assuming challenge starts June 1st)
     current_day = (datetime.now(utc).date() - datetime(2025, 6, 1, tzinfo=utc).date()).days+1
-    print(current_day)
-    # Re-load the challenges every time this function is called
-    ALL_CHALLENGES = load_challenges_from_json()
-
     if 1 <= current_day <= 30:
-        challenge = ALL_CHALLENGES.get(current_day, {})
+        # Re-fetched every time so newly published solution links are picked up
+        challenge = get_challenge(current_day)
         if not challenge:
-            logging.warning(f"No challenge found for Day {current_day}")
+            logging.warning("No challenge found for Day %s", current_day)
             return
 
-        youtube_link = challenge.get("youtubeLink", "[Link coming soon]")
-        solution_link = challenge.get("solutionLink", CHALLENGE_URL)
+        youtube_link = challenge.youtube_link or "[Link coming soon]"
+        solution_link = challenge.solution_link or CHALLENGE_URL
 
         if youtube_link != "[Link coming soon]" and solution_link != CHALLENGE_URL:
             message = (f"📣 *SOLUTION REVEAL: DAY {current_day}* 📣\n\n"
                        f"The official solution for yesterdays's challenge is now live!\n\n"
-                       f"📜 *Challenge:* `{challenge.get('contractName', f'Day {current_day} Challenge')}`\n\n"
+                       f"📜 *Challenge:* `{challenge.contract_name}`\n\n"
                        f"🧠 *Solution Link:* [View Solution]({solution_link})\n"
                        f"📺 *Video Walkthrough:* [Watch Here]({youtube_link})\n\n"
                        f"🎯 Compare your approach with the official one and level up!")
@@ -396,46 +352,64 @@ async def announce_solution(application):
                        f"🎬 Video and GitHub links dropping soon 👀 Stay tuned!\n"
                        f"In the meantime, feel free to share your approach with the community!")
 
-        for chat_id in GROUP_CHAT_IDS:
-            try:
-                await application.bot.send_message(chat_id=chat_id, text=message, parse_mode="Markdown")
-                logging.info(f"Sent solution update for Day {current_day} to chat {chat_id}")
-            except Exception as e:
-                logging.error(f"Failed to send solution message to chat {chat_id}: {e}")
+        # Queue for all configured groups, the outbox worker delivers them
+        outbox.enqueue_broadcast(f"solution:{datetime.now(utc).date()}:day-{current_day}", GROUP_CHAT_IDS, message)
 
 
+def alert_admins(job_id, message):
+    """Queue a job alert for every admin, at most once per job per day."""
+    outbox.enqueue_broadcast(f"job-alert:{job_id}:{datetime.now(utc).date()}", ADMIN_USER_IDS,
+                             f"⚠️ Scheduler alert: {message}", parse_mode=None)
+
 async def main():
     """Run the scheduler"""
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
     # Initialize the application
     application = Application.builder().token(API_KEY).build()
     await application.initialize()
     await application.start()
     
-    # Set up scheduler
-    scheduler = AsyncIOScheduler(timezone=utc)
+    # Set up scheduler. A job never runs twice at once, and a run the event loop was too
+    # busy to start on time is still started if it's less than 10 minutes late.
+    # Jobs are kept in memory, so runs that fall due while the process is down are lost.
+    scheduler = AsyncIOScheduler(timezone=utc, job_defaults={
+        "max_instances": 1,
+        "coalesce": True,
+        "misfire_grace_time": 600,
+    })
+
+    def add_job(func, hour, minute, overlap="wait"):
+        # Jobs wait for (or skip) each other and are timed/profiled by job_monitor
+        job = monitored(scheduler, func.__name__, func, overlap=overlap, on_alert=alert_admins)
+        scheduler.add_job(job, 'cron', hour=hour, minute=minute, args=[application], id=func.__name__)
     
     # Schedule daily challenge announcement at 12 AM UTC
-    scheduler.add_job(announce_daily_challenge, 'cron', hour=0, minute=0, args=[application])
+    add_job(announce_daily_challenge, hour=0, minute=0)
 
     # scheduler.add_job(announce_daily_challenge, 'cron', hour=7, minute=13, args=[application])
 
 
     # Schedule reminder 3 hours before deadline (9 PM UTC)
-    scheduler.add_job(send_reminder, 'cron', hour=21, minute=0, args=[application])
+    add_job(send_reminder, hour=21, minute=0)
 
     # scheduler.add_job(send_reminder, 'cron', hour=6, minute=53, args=[application])
 
     
     # Schedule solution announcement at 12:05 AM UTC (just after next day's challenge)
-    scheduler.add_job(announce_solution, 'cron', hour=23, minute=55, args=[application])
+    add_job(announce_solution, hour=23, minute=55)
 
     # scheduler.add_job(announce_solution, 'cron', hour=7, minute=46, args=[application])
 
-    scheduler.add_job(Web3ResourceMessage, 'cron', hour=9, minute=30, args=[application])
+    # Only relevant on day 1, so a run blocked by another job is dropped rather than delayed
+    add_job(Web3ResourceMessage, hour=9, minute=30, overlap="skip")
 
     
     # Start the scheduler
     scheduler.start()
+
+    # Deliver queued messages in the background (resumes anything left pending by a previous run)
+    outbox_worker = asyncio.create_task(outbox.run_worker(application.bot))
     
     logging.info("Scheduler started. Press Ctrl+C to exit.")
     
@@ -446,6 +420,7 @@ async def main():
     except (KeyboardInterrupt, SystemExit):
         pass
     finally:
+        outbox_worker.cancel()
         await application.stop()
         await application.shutdown()
 
@@ -0,0 +1,136 @@
+import logging
+import os
+from collections import OrderedDict
+from datetime import date
+
+# Maximum number of users kept in memory (override in .env)
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+# Log hit/miss stats once every this many lookups (0 disables)
+USER_CACHE_STATS_EVERY = int(os.getenv("USER_CACHE_STATS_EVERY", "1000"))
+
+def ensure_users_table(conn):
+    """Create the users table, backfilling it from submissions the first time."""
+    c = conn.cursor()
+    c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='users'")
+    if c.fetchone():
+        # Tables created before best_streak was added
+        c.execute("PRAGMA table_info(users)")
+        if "best_streak" not in [column[1] for column in c.fetchall()]:
+            c.execute("ALTER TABLE users ADD COLUMN best_streak INTEGER NOT NULL DEFAULT 0")
+            _backfill_best_streak(c)
+            conn.commit()
+        return
+
+    # One row per user holding their latest state, so lookups and username changes touch a single row.
+    # best_streak backs the leaderboard, so it never has to aggregate the submissions table.
+    c.execute('''CREATE TABLE users
+                 (user_id INTEGER PRIMARY KEY, username TEXT, streak INTEGER NOT NULL DEFAULT 0, last_date TEXT,
+                  best_streak INTEGER NOT NULL DEFAULT 0)''')
+
+    # SQLite takes the bare columns from the row holding MAX(submission_date)
+    c.execute('''INSERT INTO users (user_id, username, streak, last_date)
+                 SELECT user_id, username, streak, MAX(submission_date) FROM submissions GROUP BY user_id''')
+    logging.info("Created users table from %s existing submitter(s)", c.rowcount)
+    _backfill_best_streak(c)
+    conn.commit()
+
+def _backfill_best_streak(c):
+    c.execute('''UPDATE users SET best_streak =
+                 COALESCE((SELECT MAX(streak) FROM submissions s WHERE s.user_id = users.user_id), 0)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_users_best_streak ON users (best_streak)")
+
+class UserState:
+    """Latest streak state of a single user."""
+    __slots__ = ("user_id", "streak", "last_date", "username")
+
+    def __init__(self, user_id, streak, last_date, username):
+        self.user_id = user_id
+        self.streak = streak
+        self.last_date = last_date
+        self.username = username
+
+class UserStateCache:
+    """Bounded LRU cache of UserState with write-through to the users table.
+
+    Users that have never submitted are cached as None so repeated /streak
+    calls from them don't hit the database either.
+    """
+
+    def __init__(self, conn, capacity=USER_CACHE_SIZE, stats_every=USER_CACHE_STATS_EVERY):
+        self.conn = conn
+        self.capacity = capacity
+        self.stats_every = stats_every
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        """Return the user's UserState, or None if they have never submitted."""
+        try:
+            state = self._entries[user_id]
+        except KeyError:
+            self.misses += 1
+            self._maybe_log_stats()
+        else:
+            self.hits += 1
+            self._maybe_log_stats()
+            self._entries.move_to_end(user_id)
+            return state
+
+        c = self.conn.cursor()
+        c.execute("SELECT streak, last_date, username FROM users WHERE user_id=?", (user_id,))
+        row = c.fetchone()
+        state = None
+        if row and row[1]:
+            state = UserState(user_id, row[0], date.fromisoformat(row[1]), row[2])
+        self._store(user_id, state)
+        return state
+
+    def record_submission(self, user_id, username, submission_date, streak):
+        """Save the user's new streak state and commit the current transaction."""
+        with self.conn:
+            self.conn.execute('''INSERT INTO users (user_id, username, streak, last_date, best_streak) VALUES (?, ?, ?, ?, ?)
+                                 ON CONFLICT(user_id) DO UPDATE SET
+                                 username=excluded.username, streak=excluded.streak, last_date=excluded.last_date,
+                                 best_streak=MAX(users.best_streak, excluded.best_streak)''',
+                              (user_id, username, streak, submission_date.isoformat(), streak))
+        self._store(user_id, UserState(user_id, streak, submission_date, username))
+
+    def set_username(self, user_id, username):
+        """Update a known user's display name."""
+        with self.conn:
+            self.conn.execute("UPDATE users SET username=? WHERE user_id=?", (username, user_id))
+        state = self._entries.get(user_id)
+        if state is not None:
+            state.username = username
+
+    def invalidate(self, user_id):
+        """Drop a user so their next lookup is read from the database."""
+        self._entries.pop(user_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        """Return hit/miss counters and current size."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._entries),
+            "capacity": self.capacity,
+        }
+
+    def _maybe_log_stats(self):
+        if self.stats_every and (self.hits + self.misses) % self.stats_every == 0:
+            stats = self.stats()
+            logging.info("User cache: %s hits, %s misses (%.1f%% hit rate), %s/%s entries",
+                         stats["hits"], stats["misses"], stats["hit_rate"] * 100, stats["size"], stats["capacity"],
+                         extra={"event": "user_cache.stats", **stats})
+
+    def _store(self, user_id, state):
+        self._entries[user_id] = state
+        self._entries.move_to_end(user_id)
+        if len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)